@@ -1,44 +1,177 @@
 from __future__ import annotations
+import asyncio
+import contextlib
 import json
-from fastapi import FastAPI
-from typing import List
-from src.storage.db import get_conn, fetch_latest_alerts
+import logging
+import sqlite3
+from fastapi import FastAPI, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional
+from src.storage.bus import SUBSCRIBER_BUFFER, alert_bus
+from src.storage.db import get_conn, init_db, fetch_latest_alerts, fetch_alerts_after, fetch_last_alert_id
 from src.api.schemas import AlertOut, HealthOut
 
+KEEPALIVE_SECONDS = 15.0
+TAIL_INTERVAL_SECONDS = 0.5
+PAGE_SIZE = 500
+# A single tail page must fit in an idle subscriber's buffer, otherwise a
+# burst of inserts would close fast consumers before they get a chance to run.
+TAIL_PAGE_SIZE = SUBSCRIBER_BUFFER // 2
+TAIL_YIELD_SECONDS = 0.005
+
+logger = logging.getLogger("hybrid_ids")
+
+def _migrate() -> None:
+    conn = get_conn()
+    try:
+        init_db(conn)
+    finally:
+        conn.close()
+
+async def _tail_alerts() -> None:
+    """
+    Alerts are written by the detection run in a separate process, so the
+    API feeds its own bus by tailing alerts.id. One primary-key range query
+    per interval serves every stream subscriber.
+    """
+    conn = None
+    last_id = None
+    try:
+        while True:
+            try:
+                if conn is None:
+                    conn = await run_in_threadpool(get_conn)
+                if last_id is None:
+                    last_id = await run_in_threadpool(fetch_last_alert_id, conn)
+                rows = await run_in_threadpool(fetch_alerts_after, conn, last_id, TAIL_PAGE_SIZE)
+            except (sqlite3.Error, OSError):
+                logger.exception("Alert tail query failed; retrying")
+                rows = []
+            for r in rows:
+                alert_bus.publish(r)
+                last_id = r["id"]
+            if len(rows) < TAIL_PAGE_SIZE:
+                await asyncio.sleep(TAIL_INTERVAL_SECONDS)
+            else:
+                # A timed sleep (unlike sleep(0)) lets the loop run every
+                # ready wake-up, so stream generators drain before the next page.
+                await asyncio.sleep(TAIL_YIELD_SECONDS)
+    finally:
+        if conn is not None:
+            conn.close()
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # /alerts and /stats filter on incident_id, so the schema must be current
+    # before the first request; a failure here aborts startup.
+    await run_in_threadpool(_migrate)
+    tailer = asyncio.create_task(_tail_alerts())
+    yield
+    alert_bus.close_all()
+    tailer.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await tailer
+
 app = FastAPI(
     title="Hybrid IDS API",
     description="Hybrid Intrusion Detection System (PCAP + Logs)",
     version="1.0",
+    lifespan=lifespan,
 )
 
 @app.get("/health", response_model=HealthOut)
 def health():
     return {"status": "ok"}
 
+def _to_alert_out(r: Dict[str, Any]) -> AlertOut:
+    return AlertOut(
+        id=r["id"],
+        time=r["time"],
+        alert_type=r["alert_type"],
+        severity=r["severity"],
+        confidence=r["confidence"],
+        src_ip=r["src_ip"],
+        dst_ip=r["dst_ip"],
+        evidence_json=json.loads(r["evidence_json"]),
+        incident_id=r.get("incident_id"),
+    )
+
+def _sse_event(r: Dict[str, Any]) -> str:
+    return f"id: {r['id']}\nevent: alert\ndata: {_to_alert_out(r).model_dump_json()}\n\n"
+
 @app.get("/alerts", response_model=List[AlertOut])
-def get_alerts(limit: int = 50):
+def get_alerts(limit: int = 50, include_correlated: bool = False):
+    # Alerts already folded into an incident are hidden unless asked for.
     conn = get_conn()
-    rows = fetch_latest_alerts(conn, limit=limit)
-    alerts = []
-    for r in rows:
-        alerts.append(
-            AlertOut(
-                id=r["id"],
-                time=r["time"],
-                alert_type=r["alert_type"],
-                severity=r["severity"],
-                confidence=r["confidence"],
-                src_ip=r["src_ip"],
-                dst_ip=r["dst_ip"],
-                evidence_json=json.loads(r["evidence_json"]),
-            )
-        )
-    return alerts
+    rows = fetch_latest_alerts(conn, limit=limit, include_correlated=include_correlated)
+    return [_to_alert_out(r) for r in rows]
+
+@app.get("/alerts/stream")
+async def stream_alerts(
+    last_event_id: Optional[int] = Header(default=None),
+    since_id: Optional[int] = None,
+):
+    """
+    Server-Sent Events feed of new alerts, fed from the API's alert bus.
+    Reconnecting clients resume after `Last-Event-ID` (or `?since_id=`);
+    SQLite is only read when the bus history no longer covers that gap.
+    """
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    last_id = last_event_id if last_event_id is not None else since_id
+    sub, backlog, complete = alert_bus.subscribe(
+        last_id=last_id,
+        notify=lambda: loop.call_soon_threadsafe(wakeup.set),
+    )
+
+    async def events():
+        sent = last_id if last_id is not None else -1
+        try:
+            if not complete:
+                # Page the gap in from SQLite until it meets the bus backlog,
+                # so a client far behind never skips ids.
+                conn = await run_in_threadpool(get_conn)
+                try:
+                    stop = backlog[0]["id"] if backlog else None
+                    while stop is None or sent < stop - 1:
+                        rows = await run_in_threadpool(fetch_alerts_after, conn, sent, PAGE_SIZE)
+                        for r in rows:
+                            sent = r["id"]
+                            yield _sse_event(r)
+                        if len(rows) < PAGE_SIZE:
+                            break
+                finally:
+                    conn.close()
+            pending = backlog
+            while True:
+                for r in pending:
+                    if r["id"] <= sent:
+                        continue
+                    sent = r["id"]
+                    yield _sse_event(r)
+                if sub.closed:
+                    return
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                wakeup.clear()
+                pending = sub.drain()
+        finally:
+            alert_bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 @app.get("/stats")
-def stats():
+def stats(include_correlated: bool = False):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT severity, COUNT(*) as cnt FROM alerts GROUP BY severity")
+    where = "" if include_correlated else "WHERE incident_id IS NULL "
+    cur.execute(f"SELECT severity, COUNT(*) as cnt FROM alerts {where}GROUP BY severity")
     rows = cur.fetchall()
     return {r["severity"]: r["cnt"] for r in rows}
\ No newline at end of file
@@ -10,6 +10,7 @@ class AlertOut(BaseModel):
     src_ip: Optional[str]
     dst_ip: Optional[str]
     evidence_json: Dict[str, Any]
+    incident_id: Optional[int] = None
 
 class HealthOut(BaseModel):
     status: str
\ No newline at end of file
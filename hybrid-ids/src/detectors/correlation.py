@@ -0,0 +1,337 @@
+from __future__ import annotations
+import json
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from storage.bus import AlertBus, Subscription
+from storage.db import insert_alert, link_alerts_to_incident
+
+TTL_SECONDS = 300
+MAX_ENTITIES = 10_000
+MAX_EVENTS_PER_ENTITY = 64
+MAX_OPEN_INCIDENTS = 1_000
+MAX_BUFFERED_ALERTS = 200_000
+MAX_PEERS_SAMPLE = 20
+MAX_ALERT_IDS_SAMPLE = 20
+
+CORRELATED_TYPES = {"PORT_SCAN", "TRAFFIC_SPIKE", "DNS_BURST", "ANOMALOUS_FLOW"}
+SEVERITY_WEIGHT = {"LOW": 1.0, "MEDIUM": 2.0, "HIGH": 3.0}
+
+logger = logging.getLogger("hybrid_ids")
+
+def iso_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _event_ts(alert: Dict[str, Any]) -> Optional[Tuple[float, str]]:
+    """
+    Correlation runs on traffic time (the flow window), not insert time,
+    so replaying an old PCAP still lines steps up correctly. Returns None
+    when neither the window nor the alert time is a usable ISO timestamp.
+    """
+    try:
+        evidence = json.loads(alert["evidence_json"] or "{}")
+    except (TypeError, ValueError):
+        evidence = {}
+    window = evidence.get("window") if isinstance(evidence, dict) else None
+    start = window[0] if isinstance(window, list) and window else alert["time"]
+    try:
+        return datetime.fromisoformat(start).timestamp(), start
+    except (TypeError, ValueError):
+        return None
+
+@dataclass
+class _Event:
+    # One object per alert, shared by the src and dst tables, so `claimed`
+    # holds across both and an alert belongs to at most one incident.
+    ts: float
+    alert_type: str
+    alert_id: int
+    window: str
+    src_ip: Optional[str]
+    dst_ip: Optional[str]
+    weight: float
+    claimed: bool = False
+
+@dataclass
+class _EntityState:
+    last_seen: float
+    events: Deque[_Event] = field(default_factory=lambda: deque(maxlen=MAX_EVENTS_PER_ENTITY))
+
+class _EntityTable:
+    """
+    Per-IP state ordered by last activity. Alerts are replayed in traffic
+    time, so the oldest entries sit at the front and TTL and capacity
+    eviction only ever pop from the left.
+    """
+
+    def __init__(self, ttl: float, max_entities: int):
+        self.ttl = ttl
+        self.max_entities = max_entities
+        self._states: "OrderedDict[str, _EntityState]" = OrderedDict()
+
+    def touch(self, ip: str, ts: float) -> _EntityState:
+        state = self._states.get(ip)
+        if state is None:
+            state = _EntityState(last_seen=ts)
+            self._states[ip] = state
+            if len(self._states) > self.max_entities:
+                self._states.popitem(last=False)
+        else:
+            state.last_seen = ts
+            self._states.move_to_end(ip)
+        while state.events and state.events[0].ts < ts - self.ttl:
+            state.events.popleft()
+        return state
+
+    def evict(self, watermark: float) -> None:
+        while self._states:
+            state = next(iter(self._states.values()))
+            if state.last_seen >= watermark - self.ttl:
+                break
+            self._states.popitem(last=False)
+
+@dataclass
+class _Incident:
+    pattern: str
+    role: str
+    ip: str
+    opened: float
+    bonus: float
+    score: float = 0.0
+    alert_ids: Set[int] = field(default_factory=set)
+    alert_types: Set[str] = field(default_factory=set)
+    peers: Set[str] = field(default_factory=set)
+    first_window: str = ""
+    last_window: str = ""
+
+    def add(self, events: List[_Event]) -> None:
+        for e in events:
+            if e.claimed:
+                continue
+            e.claimed = True
+            # The full id set is only kept for linking; evidence gets a sample.
+            self.alert_ids.add(e.alert_id)
+            self.alert_types.add(e.alert_type)
+            peer_ip = e.dst_ip if self.role == "src_ip" else e.src_ip
+            if peer_ip is not None and len(self.peers) < MAX_PEERS_SAMPLE:
+                self.peers.add(peer_ip)
+            self.score += e.weight
+            if not self.first_window or e.window < self.first_window:
+                self.first_window = e.window
+            if e.window > self.last_window:
+                self.last_window = e.window
+
+class Correlator:
+    """
+    Matches multi-step patterns across independent detector alerts and
+    folds them into scored incidents:
+
+    - SCAN_THEN_SPIKE: a port scan followed by a traffic spike to the same target
+    - REPEATED_ANOMALY: one source flagged as anomalous in several windows
+    - MULTI_STAGE: one source tripping several different detectors
+
+    This is a post-run batch pass, not a streaming stage: detectors sweep
+    the whole capture one after another, so alerts arrive out of traffic
+    order. While attached, the bus subscription only collects a slim
+    record per alert (at most `max_buffered`; later alerts are counted,
+    logged and left uncorrelated). flush() sorts them by flow window and
+    replays them through TTL-bounded per-IP state.
+
+    An incident stays open for one TTL and absorbs further matching alerts.
+    Each alert joins at most one incident; it is linked to it and drops out
+    of the default /alerts view.
+    """
+
+    def __init__(
+        self,
+        ttl: float = TTL_SECONDS,
+        max_entities: int = MAX_ENTITIES,
+        min_anomaly_windows: int = 3,
+        min_stage_types: int = 3,
+        max_buffered: int = MAX_BUFFERED_ALERTS,
+    ):
+        self.ttl = ttl
+        self.min_anomaly_windows = min_anomaly_windows
+        self.min_stage_types = min_stage_types
+        self.max_buffered = max_buffered
+        self._by_src = _EntityTable(ttl, max_entities)
+        self._by_dst = _EntityTable(ttl, max_entities)
+        self._watermark = 0.0
+        self._buffer: List[_Event] = []
+        self._dropped = 0
+        self._open: "OrderedDict[Tuple[str, str, str], _Incident]" = OrderedDict()
+        self._bus: Optional[AlertBus] = None
+        self._sub: Optional[Subscription] = None
+
+    def attach(self, bus: AlertBus) -> None:
+        # Drained synchronously on every publish, so the subscription never backs up.
+        self._bus = bus
+        self._sub = bus.subscribe(notify=self._on_publish)[0]
+
+    def detach(self) -> None:
+        if self._bus is not None and self._sub is not None:
+            self._bus.unsubscribe(self._sub)
+            self._sub = None
+
+    def _on_publish(self) -> None:
+        if self._sub is None:
+            return
+        for alert in self._sub.drain():
+            self.observe(alert)
+
+    def observe(self, alert: Dict[str, Any]) -> None:
+        if alert["alert_type"] not in CORRELATED_TYPES:
+            return
+        parsed = _event_ts(alert)
+        if parsed is None:
+            logger.warning("Skipping alert %s in correlation: no usable timestamp", alert["id"])
+            return
+        if len(self._buffer) >= self.max_buffered:
+            if not self._dropped:
+                logger.warning("Correlation buffer full (%d alerts); further alerts are not correlated", self.max_buffered)
+            self._dropped += 1
+            return
+        ts, window = parsed
+        weight = SEVERITY_WEIGHT.get(alert["severity"], 1.0) * float(alert["confidence"])
+        self._buffer.append(
+            _Event(ts, alert["alert_type"], alert["id"], window, alert["src_ip"], alert["dst_ip"], weight)
+        )
+
+    def flush(self, conn) -> int:
+        """
+        Replays buffered alerts in traffic-time order and stores the
+        resulting incidents. Returns the number of incidents stored.
+        """
+        if self._dropped:
+            logger.warning("Correlation buffer full: %d alerts were not correlated", self._dropped)
+            self._dropped = 0
+        self._buffer.sort(key=lambda e: (e.ts, e.alert_id))
+        buffered, self._buffer = self._buffer, []
+
+        stored = 0
+        for event in buffered:
+            # Close expired incidents first so a late alert starts a new one.
+            stored += self._close_incidents(conn, expire_before=event.ts - self.ttl)
+            self._process(event)
+        stored += self._close_incidents(conn)
+        return stored
+
+    def _process(self, event: _Event) -> None:
+        ts = event.ts
+        if ts > self._watermark:
+            self._watermark = ts
+            self._by_src.evict(ts)
+            self._by_dst.evict(ts)
+
+        src_state = dst_state = None
+        if event.src_ip is not None:
+            src_state = self._by_src.touch(event.src_ip, ts)
+            src_state.events.append(event)
+        if event.dst_ip is not None:
+            dst_state = self._by_dst.touch(event.dst_ip, ts)
+            dst_state.events.append(event)
+
+        # Most specific pattern first; each match claims the alert.
+        if dst_state is not None and event.alert_type in ("PORT_SCAN", "TRAFFIC_SPIKE"):
+            self._match_scan_then_spike(event.dst_ip, dst_state, event)
+        if src_state is not None and not event.claimed and event.alert_type == "ANOMALOUS_FLOW":
+            self._match_repeated_anomaly(event.src_ip, src_state, event)
+        if src_state is not None and not event.claimed:
+            self._match_multi_stage(event.src_ip, src_state, event)
+
+    def _match_scan_then_spike(self, dst_ip: str, state: _EntityState, event: _Event) -> bool:
+        key = ("SCAN_THEN_SPIKE", "dst_ip", dst_ip)
+        if key in self._open:
+            self._open[key].add([event])
+            return True
+        if event.alert_type != "TRAFFIC_SPIKE":
+            return False
+        unclaimed = [e for e in state.events if not e.claimed]
+        # The scan has to come first; a scan in the spike's own window is
+        # one heavy flow, not two steps.
+        scans = [e for e in unclaimed if e.alert_type == "PORT_SCAN" and e.ts < event.ts]
+        if not scans:
+            return False
+        first_scan = min(e.ts for e in scans)
+        spikes = [e for e in unclaimed if e.alert_type == "TRAFFIC_SPIKE" and e.ts > first_scan]
+        self._open_incident(key, event.ts, scans + spikes, bonus=2.0)
+        return True
+
+    def _match_repeated_anomaly(self, src_ip: str, state: _EntityState, event: _Event) -> bool:
+        key = ("REPEATED_ANOMALY", "src_ip", src_ip)
+        if key in self._open:
+            self._open[key].add([event])
+            return True
+        anomalies = [e for e in state.events if not e.claimed and e.alert_type == "ANOMALOUS_FLOW"]
+        if len({e.window for e in anomalies}) < self.min_anomaly_windows:
+            return False
+        self._open_incident(key, event.ts, anomalies, bonus=1.0)
+        return True
+
+    def _match_multi_stage(self, src_ip: str, state: _EntityState, event: _Event) -> bool:
+        key = ("MULTI_STAGE", "src_ip", src_ip)
+        if key in self._open:
+            self._open[key].add([event])
+            return True
+        unclaimed = [e for e in state.events if not e.claimed]
+        if len({e.alert_type for e in unclaimed}) < self.min_stage_types:
+            return False
+        self._open_incident(key, event.ts, unclaimed, bonus=2.0)
+        return True
+
+    def _open_incident(self, key: Tuple[str, str, str], ts: float, events: List[_Event], bonus: float) -> None:
+        pattern, role, ip = key
+        incident = _Incident(pattern=pattern, role=role, ip=ip, opened=ts, bonus=bonus)
+        incident.add(events)
+        self._open[key] = incident
+
+    def _close_incidents(self, conn, expire_before: Optional[float] = None) -> int:
+        """
+        Writes incidents whose TTL has run out (all of them when
+        `expire_before` is None). The open set is also capped, so a flood of
+        distinct entities gets its incidents written early rather than held.
+        """
+        stored = 0
+        while self._open:
+            incident = next(iter(self._open.values()))
+            expired = expire_before is None or incident.opened < expire_before
+            if not expired and len(self._open) <= MAX_OPEN_INCIDENTS:
+                break
+            self._open.popitem(last=False)
+            self._store_incident(conn, incident)
+            stored += 1
+        return stored
+
+    def _store_incident(self, conn, incident: _Incident) -> None:
+        score = round(incident.score + incident.bonus, 2)
+        if score >= 8:
+            severity = "CRITICAL"
+        elif score >= 5:
+            severity = "HIGH"
+        else:
+            severity = "MEDIUM"
+
+        alert_ids = sorted(incident.alert_ids)
+        evidence = {
+            "pattern": incident.pattern,
+            "score": score,
+            "entity": {incident.role: incident.ip},
+            "alert_count": len(alert_ids),
+            "alert_ids_sample": alert_ids[:MAX_ALERT_IDS_SAMPLE],
+            "alert_types": sorted(incident.alert_types),
+            "peers_sample": sorted(incident.peers),
+            "window": [incident.first_window, incident.last_window],
+        }
+        incident_id = insert_alert(
+            conn=conn,
+            time=iso_now(),
+            alert_type=incident.pattern,
+            severity=severity,
+            confidence=min(1.0, score / 10.0),
+            src_ip=incident.ip if incident.role == "src_ip" else None,
+            dst_ip=incident.ip if incident.role == "dst_ip" else None,
+            evidence_json=json.dumps(evidence),
+        )
+        link_alerts_to_incident(conn, incident_id, alert_ids)
\ No newline at end of file
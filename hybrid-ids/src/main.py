@@ -7,6 +7,8 @@ from capture_pcap import read_pcap_events
 from flow_builder import build_flows
 from detectors.rules import run_rules
 from detectors.anomaly import detect_anomalies
+from detectors.correlation import Correlator
+from storage.bus import alert_bus
 
 def iso_now() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -65,12 +67,17 @@ def main():
 
     logger.info("Stored flows in DB: %d", stored)
     logger.info("Next: rules-based detector will read flows and emit alerts.")
+    correlator = Correlator()
+    correlator.attach(alert_bus)
     logger.info("Running rules-based detection...")
     run_rules(flows, conn)
     logger.info("Rules detection complete.")
     logger.info("Running anomaly-based detection...")
     detect_anomalies(flows, conn)
     logger.info("Anomaly detection complete.")
+    correlator.detach()
+    incidents = correlator.flush(conn)
+    logger.info("Correlated incidents stored: %d", incidents)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,126 @@
+from __future__ import annotations
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+HISTORY_SIZE = 1000
+SUBSCRIBER_BUFFER = 256
+
+logger = logging.getLogger("hybrid_ids")
+
+class Subscription:
+    """
+    Bounded per-consumer buffer. A subscriber that falls more than `maxlen`
+    alerts behind is closed rather than blocking the publisher; it is
+    expected to reconnect and resume from the last id it saw.
+    """
+
+    def __init__(self, maxlen: int = SUBSCRIBER_BUFFER, notify: Optional[Callable[[], None]] = None):
+        self.maxlen = maxlen
+        self.notify = notify
+        self.closed = False
+        self._buf: Deque[Dict[str, Any]] = deque()
+        self._lock = threading.Lock()
+
+    def _offer(self, alert: Dict[str, Any]) -> bool:
+        with self._lock:
+            if self.closed:
+                return False
+            if len(self._buf) >= self.maxlen:
+                self.closed = True
+                self._buf.clear()
+            else:
+                self._buf.append(alert)
+        if self.notify is not None:
+            self.notify()
+        return not self.closed
+
+    def drain(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._buf)
+            self._buf.clear()
+        return items
+
+class AlertBus:
+    """
+    In-process publish/subscribe fan-out for freshly inserted alerts.
+    Keeps a short history so reconnecting clients can resume by alert id.
+    """
+
+    def __init__(self, history_size: int = HISTORY_SIZE):
+        self._history: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        self._subs: List[Subscription] = []
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(self, alert: Dict[str, Any]) -> None:
+        # Alert ids only grow, so anything at or below the last published id
+        # has already been fanned out (e.g. by both insert_alert and a tailer).
+        with self._lock:
+            if alert["id"] <= self._last_id:
+                return
+            self._last_id = alert["id"]
+            self._history.append(alert)
+            subs = list(self._subs)
+        dead = []
+        for s in subs:
+            try:
+                alive = s._offer(alert)
+            except Exception:
+                logger.exception("Alert bus subscriber failed; dropping it")
+                s.closed = True
+                alive = False
+            if not alive:
+                dead.append(s)
+        if dead:
+            with self._lock:
+                self._subs = [s for s in self._subs if s not in dead]
+
+    def subscribe(
+        self,
+        last_id: Optional[int] = None,
+        maxlen: int = SUBSCRIBER_BUFFER,
+        notify: Optional[Callable[[], None]] = None,
+    ) -> Tuple[Subscription, List[Dict[str, Any]], bool]:
+        """
+        Registers a subscriber and returns (subscription, backlog, complete).
+        `backlog` holds history newer than `last_id`; `complete` is False when
+        the history no longer reaches back that far and the caller must fill
+        the gap from storage.
+        """
+        sub = Subscription(maxlen=maxlen, notify=notify)
+        with self._lock:
+            self._subs.append(sub)
+            if last_id is None:
+                return sub, [], True
+            backlog = [a for a in self._history if a["id"] > last_id]
+            complete = bool(self._history) and self._history[0]["id"] <= last_id + 1
+        return sub, backlog, complete
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+        sub.closed = True
+
+    def close_all(self) -> None:
+        with self._lock:
+            subs, self._subs = self._subs, []
+        for s in subs:
+            s.closed = True
+            if s.notify is not None:
+                try:
+                    s.notify()
+                except Exception:
+                    logger.exception("Alert bus subscriber failed on close")
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+alert_bus = AlertBus()
\ No newline at end of file
@@ -1,7 +1,8 @@
 import sqlite3
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Optional
 from .models import CREATE_ALERTS_TABLE, CREATE_FLOWS_TABLE, CREATE_INDEXES
+from .bus import alert_bus
 
 def get_conn(db_path: str = "data/db/ids.db") -> sqlite3.Connection:
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
@@ -13,6 +14,9 @@ def init_db(conn: sqlite3.Connection) -> None:
     cur = conn.cursor()
     cur.execute(CREATE_FLOWS_TABLE)
     cur.execute(CREATE_ALERTS_TABLE)
+    cur.execute("PRAGMA table_info(alerts)")
+    if "incident_id" not in {r["name"] for r in cur.fetchall()}:
+        cur.execute("ALTER TABLE alerts ADD COLUMN incident_id INTEGER")
     for stmt in CREATE_INDEXES.strip().split(";"):
         if stmt.strip():
             cur.execute(stmt)
@@ -37,7 +41,20 @@ def insert_alert(
         (time, alert_type, severity, confidence, src_ip, dst_ip, evidence_json),
     )
     conn.commit()
-    return int(cur.lastrowid)
+    alert_id = int(cur.lastrowid)
+    alert_bus.publish(
+        {
+            "id": alert_id,
+            "time": time,
+            "alert_type": alert_type,
+            "severity": severity,
+            "confidence": confidence,
+            "src_ip": src_ip,
+            "dst_ip": dst_ip,
+            "evidence_json": evidence_json,
+        }
+    )
+    return alert_id
 
 def insert_flow(
     conn: sqlite3.Connection,
@@ -74,11 +91,38 @@ def insert_flow(
     conn.commit()
     return int(cur.lastrowid)
 
-def fetch_latest_alerts(conn: sqlite3.Connection, limit: int = 50) -> list[Dict[str, Any]]:
+def link_alerts_to_incident(conn: sqlite3.Connection, incident_id: int, alert_ids: Iterable[int]) -> None:
+    cur = conn.cursor()
+    cur.executemany(
+        "UPDATE alerts SET incident_id = ? WHERE id = ? AND incident_id IS NULL",
+        [(incident_id, alert_id) for alert_id in alert_ids],
+    )
+    conn.commit()
+
+def fetch_latest_alerts(
+    conn: sqlite3.Connection,
+    limit: int = 50,
+    include_correlated: bool = False,
+) -> list[Dict[str, Any]]:
     cur = conn.cursor()
+    where = "" if include_correlated else "WHERE incident_id IS NULL "
     cur.execute(
-        "SELECT * FROM alerts ORDER BY time DESC, id DESC LIMIT ?",
+        f"SELECT * FROM alerts {where}ORDER BY time DESC, id DESC LIMIT ?",
         (limit,),
     )
     rows = cur.fetchall()
-    return [dict(r) for r in rows]
\ No newline at end of file
+    return [dict(r) for r in rows]
+
+def fetch_alerts_after(conn: sqlite3.Connection, last_id: int, limit: int = 1000) -> list[Dict[str, Any]]:
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT * FROM alerts WHERE id > ? ORDER BY id ASC LIMIT ?",
+        (last_id, limit),
+    )
+    rows = cur.fetchall()
+    return [dict(r) for r in rows]
+
+def fetch_last_alert_id(conn: sqlite3.Connection) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(MAX(id), 0) AS last_id FROM alerts")
+    return int(cur.fetchone()["last_id"])
\ No newline at end of file
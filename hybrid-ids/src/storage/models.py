@@ -33,11 +33,15 @@ CREATE TABLE IF NOT EXISTS alerts (
     src_ip TEXT,
     dst_ip TEXT,
 
-    evidence_json TEXT
+    evidence_json TEXT,
+
+    -- set once the alert has been folded into a correlated incident
+    incident_id INTEGER
 );
 """
 
 CREATE_INDEXES = """
 CREATE INDEX IF NOT EXISTS idx_alerts_time ON alerts(time);
+CREATE INDEX IF NOT EXISTS idx_alerts_incident ON alerts(incident_id);
 CREATE INDEX IF NOT EXISTS idx_flows_window ON flows(window_start, window_end);
 """
\ No newline at end of file
@@ -0,0 +1,9 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The API imports through the src package, while pipeline modules import each
+# other as top-level packages (storage, detectors, ...).
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "src"))
\ No newline at end of file
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+from src.api import api
+from src.storage import db
+from src.storage.bus import AlertBus
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "ids.db")
+    monkeypatch.setattr(api, "get_conn", lambda: db.get_conn(path))
+    conn = db.get_conn(path)
+    db.init_db(conn)
+    conn.close()
+    return path
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = AlertBus()
+    monkeypatch.setattr(api, "alert_bus", bus)
+    monkeypatch.setattr(api, "KEEPALIVE_SECONDS", 0.05)
+    monkeypatch.setattr(api, "TAIL_INTERVAL_SECONDS", 0.01)
+    return bus
+
+def _insert_rows(path, count):
+    conn = db.get_conn(path)
+    try:
+        for _ in range(count):
+            db.insert_alert(
+                conn=conn,
+                time="2024-01-01T00:00:00+00:00",
+                alert_type="PORT_SCAN",
+                severity="HIGH",
+                confidence=0.8,
+                src_ip="10.0.0.1",
+                dst_ip="10.0.0.9",
+                evidence_json=json.dumps({"window": ["2024-01-01T00:00:00+00:00"]}),
+            )
+        return db.fetch_alerts_after(conn, 0, limit=count + 1000)
+    finally:
+        conn.close()
+
+def _stream_ids(bus, headers=None, params=None, during=None):
+    """
+    Opens /alerts/stream, runs `during` once the client is subscribed, then
+    closes the bus so the otherwise endless response completes.
+    """
+    def drive():
+        deadline = time.time() + 5
+        while bus.subscriber_count() == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        if during is not None:
+            during()
+        time.sleep(0.3)
+        bus.close_all()
+
+    with TestClient(api.app) as client:
+        driver = threading.Thread(target=drive)
+        driver.start()
+        resp = client.get("/alerts/stream", headers=headers or {}, params=params or {})
+        driver.join()
+    assert resp.status_code == 200
+    return [int(line[len("id: "):]) for line in resp.text.splitlines() if line.startswith("id: ")]
+
+def test_stream_pushes_published_alerts(db_path, bus):
+    rows = _insert_rows(db_path, 3)
+    ids = _stream_ids(bus, during=lambda: [bus.publish(r) for r in rows])
+    assert ids == [1, 2, 3]
+
+def test_stream_is_fed_by_tailing_sqlite(db_path, bus):
+    # Rows written by another process after the API started reach the stream.
+    ids = _stream_ids(bus, during=lambda: _insert_rows(db_path, 4))
+    assert ids == [1, 2, 3, 4]
+
+def test_resume_from_bus_history_does_not_need_sqlite(db_path, bus):
+    for alert_id in range(1, 6):
+        bus.publish({
+            "id": alert_id, "time": "t", "alert_type": "PORT_SCAN", "severity": "HIGH",
+            "confidence": 0.8, "src_ip": None, "dst_ip": None, "evidence_json": "{}",
+        })
+    assert _stream_ids(bus, headers={"Last-Event-ID": "2"}) == [3, 4, 5]
+
+@pytest.mark.parametrize("history_start", [7, 8])
+def test_gap_fill_pages_until_it_meets_history(db_path, monkeypatch, history_start):
+    monkeypatch.setattr(api, "PAGE_SIZE", 3)
+    rows = _insert_rows(db_path, 10)
+    bus = AlertBus(history_size=11 - history_start)
+    monkeypatch.setattr(api, "alert_bus", bus)
+    monkeypatch.setattr(api, "KEEPALIVE_SECONDS", 0.05)
+    for r in rows[history_start - 1:]:
+        bus.publish(r)
+    # Pages of 3 from id 1 end exactly at 7 (meets history at 8) or overlap it (7).
+    assert _stream_ids(bus, headers={"Last-Event-ID": "1"}) == list(range(2, 11))
+
+def test_resume_with_empty_history_reads_sqlite(db_path, bus):
+    _insert_rows(db_path, 5)
+    assert _stream_ids(bus, params={"since_id": 2}) == [3, 4, 5]
+
+def test_last_event_id_takes_precedence_over_since_id(db_path, bus):
+    _insert_rows(db_path, 5)
+    assert _stream_ids(bus, headers={"Last-Event-ID": "3"}, params={"since_id": 1}) == [4, 5]
+
+def test_fast_consumer_survives_tail_burst(db_path, bus):
+    total = api.TAIL_PAGE_SIZE * 3 + 5
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        sub, _, _ = bus.subscribe(notify=lambda: loop.call_soon_threadsafe(wakeup.set))
+        tailer = asyncio.create_task(api._tail_alerts())
+        await asyncio.sleep(0.05)
+        writer = asyncio.create_task(asyncio.to_thread(_insert_rows, db_path, total))
+        received = []
+        while len(received) < total and not sub.closed:
+            await asyncio.wait_for(wakeup.wait(), timeout=5)
+            wakeup.clear()
+            received.extend(a["id"] for a in sub.drain())
+        await writer
+        tailer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tailer
+        return sub.closed, received
+
+    closed, received = asyncio.run(scenario())
+    assert not closed
+    assert received == list(range(1, total + 1))
+
+def test_stats_hide_correlated_alerts_unless_asked(db_path, bus):
+    _insert_rows(db_path, 3)
+    conn = db.get_conn(db_path)
+    db.link_alerts_to_incident(conn, 3, [1, 2])
+    conn.close()
+    with TestClient(api.app) as client:
+        assert client.get("/stats").json() == {"HIGH": 1}
+        assert client.get("/stats", params={"include_correlated": True}).json() == {"HIGH": 3}
\ No newline at end of file
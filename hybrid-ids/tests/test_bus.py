@@ -0,0 +1,65 @@
+from storage.bus import SUBSCRIBER_BUFFER, AlertBus
+
+def _alert(alert_id):
+    return {"id": alert_id, "alert_type": "PORT_SCAN"}
+
+def test_failing_subscriber_is_dropped_without_affecting_others():
+    bus = AlertBus()
+
+    def boom():
+        raise RuntimeError("loop closed")
+
+    bad, _, _ = bus.subscribe(notify=boom)
+    good, _, _ = bus.subscribe()
+    bus.publish(_alert(1))
+    bus.publish(_alert(2))
+
+    assert bad.closed
+    assert [a["id"] for a in good.drain()] == [1, 2]
+    assert bus.subscriber_count() == 1
+
+def test_republished_ids_are_ignored():
+    bus = AlertBus()
+    sub, _, _ = bus.subscribe()
+    for alert_id in (1, 2, 2, 1, 3):
+        bus.publish(_alert(alert_id))
+    assert [a["id"] for a in sub.drain()] == [1, 2, 3]
+
+def test_resume_reports_incomplete_history():
+    bus = AlertBus(history_size=2)
+    for alert_id in (1, 2, 3, 4):
+        bus.publish(_alert(alert_id))
+    _, backlog, complete = bus.subscribe(last_id=1)
+    assert [a["id"] for a in backlog] == [3, 4]
+    assert not complete
+    _, backlog, complete = bus.subscribe(last_id=2)
+    assert [a["id"] for a in backlog] == [3, 4]
+    assert complete
+
+def test_slow_subscriber_is_dropped_on_overflow():
+    bus = AlertBus()
+    slow, _, _ = bus.subscribe(maxlen=3)
+    fast, _, _ = bus.subscribe(maxlen=3)
+    for alert_id in range(1, 7):
+        bus.publish(_alert(alert_id))
+        fast.drain()
+    assert slow.closed
+    assert slow.drain() == []
+    assert not fast.closed
+    assert bus.subscriber_count() == 1
+
+def test_idle_subscriber_absorbs_a_full_buffer():
+    bus = AlertBus()
+    sub, _, _ = bus.subscribe()
+    for alert_id in range(1, SUBSCRIBER_BUFFER + 1):
+        bus.publish(_alert(alert_id))
+    assert not sub.closed
+    assert len(sub.drain()) == SUBSCRIBER_BUFFER
+
+def test_close_all_wakes_subscribers():
+    bus = AlertBus()
+    woken = []
+    sub, _, _ = bus.subscribe(notify=lambda: woken.append(True))
+    bus.close_all()
+    assert sub.closed and woken == [True]
+    assert bus.subscriber_count() == 0
\ No newline at end of file
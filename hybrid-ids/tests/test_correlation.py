@@ -0,0 +1,166 @@
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+from detectors.correlation import MAX_ALERT_IDS_SAMPLE, Correlator
+from storage.bus import AlertBus
+from storage.db import get_conn, init_db, insert_alert, fetch_latest_alerts
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = get_conn(str(tmp_path / "ids.db"))
+    init_db(conn)
+    yield conn
+    conn.close()
+
+def _window(minutes):
+    start = T0 + timedelta(minutes=minutes)
+    return [start.isoformat(), (start + timedelta(seconds=10)).isoformat()]
+
+def _alert(conn, alert_type, src_ip, dst_ip, minutes, severity="HIGH", confidence=0.8, evidence=None):
+    evidence_json = json.dumps({"window": _window(minutes)}) if evidence is None else evidence
+    alert_id = insert_alert(
+        conn=conn,
+        time=T0.isoformat(),
+        alert_type=alert_type,
+        severity=severity,
+        confidence=confidence,
+        src_ip=src_ip,
+        dst_ip=dst_ip,
+        evidence_json=evidence_json,
+    )
+    return {
+        "id": alert_id,
+        "time": T0.isoformat(),
+        "alert_type": alert_type,
+        "severity": severity,
+        "confidence": confidence,
+        "src_ip": src_ip,
+        "dst_ip": dst_ip,
+        "evidence_json": evidence_json,
+    }
+
+def _incidents(conn, pattern):
+    """Evidence of each incident of `pattern`, with the ids actually linked to it."""
+    incidents = []
+    for r in conn.execute("SELECT * FROM alerts WHERE alert_type = ? ORDER BY id", (pattern,)).fetchall():
+        evidence = json.loads(r["evidence_json"])
+        linked = conn.execute("SELECT id FROM alerts WHERE incident_id = ? ORDER BY id", (r["id"],)).fetchall()
+        evidence["linked_ids"] = [l["id"] for l in linked]
+        incidents.append(evidence)
+    return incidents
+
+def test_scan_then_spike_follows_traffic_time_not_detector_order(conn):
+    correlator = Correlator()
+    # run_rules sweeps the whole capture per detector: all scans, then all spikes.
+    scan0 = _alert(conn, "PORT_SCAN", "10.0.0.1", "10.0.0.9", 0)
+    scan20 = _alert(conn, "PORT_SCAN", "10.0.0.1", "10.0.0.9", 20)
+    spike1 = _alert(conn, "TRAFFIC_SPIKE", "10.0.0.2", "10.0.0.9", 1, severity="MEDIUM", confidence=0.6)
+    spike21 = _alert(conn, "TRAFFIC_SPIKE", "10.0.0.2", "10.0.0.9", 21, severity="MEDIUM", confidence=0.6)
+    for a in (scan0, scan20, spike1, spike21):
+        correlator.observe(a)
+    correlator.flush(conn)
+
+    incidents = _incidents(conn, "SCAN_THEN_SPIKE")
+    assert [i["linked_ids"] for i in incidents] == [
+        sorted([scan0["id"], spike1["id"]]),
+        sorted([scan20["id"], spike21["id"]]),
+    ]
+
+def test_scan_in_the_spike_window_is_not_a_second_step(conn):
+    correlator = Correlator()
+    correlator.observe(_alert(conn, "PORT_SCAN", "10.0.0.1", "10.0.0.9", 0))
+    correlator.observe(_alert(conn, "TRAFFIC_SPIKE", "10.0.0.1", "10.0.0.9", 0, severity="MEDIUM"))
+    assert correlator.flush(conn) == 0
+
+def test_one_flow_tripping_several_detectors_becomes_one_incident(conn):
+    correlator = Correlator()
+    alerts = [
+        _alert(conn, "PORT_SCAN", "10.0.0.1", "10.0.0.9", 0),
+        _alert(conn, "TRAFFIC_SPIKE", "10.0.0.1", "10.0.0.9", 0, severity="MEDIUM"),
+        _alert(conn, "ANOMALOUS_FLOW", "10.0.0.1", "10.0.0.9", 0),
+    ]
+    for a in alerts:
+        correlator.observe(a)
+    assert correlator.flush(conn) == 1
+
+    incident = _incidents(conn, "MULTI_STAGE")[0]
+    assert incident["linked_ids"] == [a["id"] for a in alerts]
+    assert incident["alert_count"] == 3
+    assert incident["score"] == round(3 * 0.8 + 2 * 0.8 + 3 * 0.8 + 2.0, 2)
+
+def test_multi_stage_is_emitted_once_with_disjoint_alerts(conn):
+    correlator = Correlator()
+    alerts = [
+        _alert(conn, "PORT_SCAN", "10.0.0.1", "10.0.0.9", 0),
+        _alert(conn, "PORT_SCAN", "10.0.0.1", "10.0.0.9", 1),
+        _alert(conn, "TRAFFIC_SPIKE", "10.0.0.1", "10.0.0.8", 0, severity="MEDIUM"),
+        _alert(conn, "DNS_BURST", "10.0.0.1", "10.0.0.53", 0, severity="MEDIUM"),
+        _alert(conn, "DNS_BURST", "10.0.0.1", "10.0.0.53", 2, severity="MEDIUM"),
+    ]
+    for a in alerts:
+        correlator.observe(a)
+    correlator.flush(conn)
+
+    incidents = _incidents(conn, "MULTI_STAGE")
+    assert len(incidents) == 1
+    assert incidents[0]["linked_ids"] == sorted(a["id"] for a in alerts)
+
+def test_matches_do_not_span_more_than_ttl(conn):
+    correlator = Correlator(ttl=300)
+    for minutes in (0, 10, 20):
+        correlator.observe(_alert(conn, "ANOMALOUS_FLOW", "10.0.0.1", "10.0.0.9", minutes))
+    correlator.flush(conn)
+    assert _incidents(conn, "REPEATED_ANOMALY") == []
+
+def test_constituents_are_linked_and_hidden(conn):
+    correlator = Correlator()
+    anomalies = [_alert(conn, "ANOMALOUS_FLOW", "10.0.0.1", "10.0.0.9", m) for m in (0, 1, 2, 3)]
+    other = _alert(conn, "DNS_BURST", "10.0.0.5", "10.0.0.53", 0, severity="MEDIUM")
+    for a in anomalies + [other]:
+        correlator.observe(a)
+    assert correlator.flush(conn) == 1
+
+    visible = fetch_latest_alerts(conn, limit=50)
+    assert sorted(r["alert_type"] for r in visible) == ["DNS_BURST", "REPEATED_ANOMALY"]
+    incident_id = next(r["id"] for r in visible if r["alert_type"] == "REPEATED_ANOMALY")
+    linked = conn.execute("SELECT id FROM alerts WHERE incident_id = ?", (incident_id,)).fetchall()
+    assert sorted(r["id"] for r in linked) == [a["id"] for a in anomalies]
+    assert len(fetch_latest_alerts(conn, limit=50, include_correlated=True)) == 6
+
+@pytest.mark.parametrize("evidence", ["[1]", '{"window": ["not-a-time"]}', '{"window": [5]}'])
+def test_unusable_alerts_are_skipped(conn, evidence):
+    correlator = Correlator()
+    correlator.observe(_alert(conn, "PORT_SCAN", "10.0.0.1", "10.0.0.9", 0, evidence=evidence))
+    assert correlator.flush(conn) == 0
+
+def test_attached_correlator_buffers_published_alerts(conn):
+    bus = AlertBus()
+    correlator = Correlator()
+    correlator.attach(bus)
+    bus.publish(_alert(conn, "TRAFFIC_SPIKE", "10.0.0.2", "10.0.0.9", 1, severity="MEDIUM"))
+    bus.publish(_alert(conn, "PORT_SCAN", "10.0.0.1", "10.0.0.9", 0))
+    correlator.detach()
+    bus.publish(_alert(conn, "TRAFFIC_SPIKE", "10.0.0.2", "10.0.0.9", 2, severity="MEDIUM"))
+    assert correlator.flush(conn) == 1
+    assert _incidents(conn, "SCAN_THEN_SPIKE")[0]["linked_ids"] == [1, 2]
+
+def test_flood_evidence_keeps_a_capped_id_sample(conn):
+    correlator = Correlator()
+    for i in range(30):
+        correlator.observe(_alert(conn, "ANOMALOUS_FLOW", "10.0.0.1", "10.0.0.9", i * 0.1))
+    assert correlator.flush(conn) == 1
+
+    incident = _incidents(conn, "REPEATED_ANOMALY")[0]
+    assert incident["alert_count"] == 30
+    assert incident["alert_ids_sample"] == list(range(1, MAX_ALERT_IDS_SAMPLE + 1))
+    assert incident["linked_ids"] == list(range(1, 31))
+
+def test_alerts_past_the_buffer_cap_are_logged_and_left_uncorrelated(conn, caplog):
+    correlator = Correlator(max_buffered=2)
+    for minutes in (0, 1, 2):
+        correlator.observe(_alert(conn, "ANOMALOUS_FLOW", "10.0.0.1", "10.0.0.9", minutes))
+    with caplog.at_level("WARNING", logger="hybrid_ids"):
+        assert correlator.flush(conn) == 0
+    assert "1 alerts were not correlated" in caplog.text
\ No newline at end of file